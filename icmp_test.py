@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+import sys
+from ping_monitor import IcmpBatcher
+
+HOSTS = 300
+
+print("="*60)
+print("ТЕСТ ПАКЕТНОГО ПИНГА (IcmpBatcher)")
+print("="*60)
+
+try:
+    batcher = IcmpBatcher()
+except OSError as e:
+    print(f"❌ Не удалось открыть ICMP-сокет: {e}")
+    print("   Запустите от root или выполните: sudo setcap cap_net_raw+ep $(which python3)")
+    sys.exit(1)
+print(f"✓ ICMP-сокет открыт ({'raw' if batcher.raw else 'dgram'})")
+
+# Весь 127.0.0.0/8 отвечает через loopback — проверяем, что ни один ответ не потерян
+addresses = [f"127.0.{i // 250}.{i % 250 + 1}" for i in range(HOSTS)]
+print(f"\nПинг {HOSTS} адресов loopback...")
+results = batcher.ping(addresses, timeout=2)
+lost = [a for a, rtt in zip(addresses, results) if rtt is None]
+if lost:
+    print(f"❌ Нет ответа от {len(lost)} из {HOSTS}: {', '.join(lost[:5])}...")
+    sys.exit(1)
+print(f"✓ Ответили все {HOSTS} адресов")
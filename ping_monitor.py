@@ -1,18 +1,212 @@
 #!/usr/bin/env python3
 """
 Ping Monitor Bot — мониторинг доступности хостов с уведомлениями в Telegram
-Использует синхронный HTTP API (requests), не требует асинхронного кода
+Использует синхронный HTTP API (httpx с HTTP/2, если установлен, иначе requests),
+не требует асинхронного кода
 """
 import yaml
+try:
+    from yaml import CSafeLoader as YamlLoader   # C-парсер на базе libyaml
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 import logging
 import time
 import sys
 import signal
 import os
 import json
+import re
+import shutil
+import subprocess
+import socket
+import ipaddress
+import threading
+import queue
+import select
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from ping3 import ping
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import numpy as np
+    import numba   # опционально: компиляция обновления состояний для сотен хостов
+except ImportError:
+    np = numba = None
+try:
+    # опционально: HTTP/2 для запросов к Telegram. httpx без h2 уже ставится вместе с
+    # python-telegram-bot, поэтому HTTP/2 используется только при наличии обоих пакетов
+    import httpx
+    import h2  # noqa: F401
+except ImportError:
+    httpx = None
+
+TELEGRAM_MAX_LENGTH = 4096  # Максимальная длина текста сообщения в Telegram
+TELEGRAM_RETRY_AFTER_MAX = 10  # Предел ожидания (сек) по retry_after перед повторной отправкой
+TAG_RE = re.compile(r'</?(?:b|code|i|u)>')  # HTML-теги разметки, убираемые из превью в логе
+
+FPING_INTERVAL_MS = 10  # Интервал fping между пакетами разным хостам (-i, минимум для не-root)
+NUMBA_MIN_HOSTS = 500  # С какого числа хостов имеет смысл компилировать update_states
+
+# События хоста за цикл проверки (массив events в update_states)
+EVENT_NONE = 0
+EVENT_FAIL = 1       # неудачная проверка доступного хоста, порог не достигнут
+EVENT_DOWN = 2       # хост признан недоступным
+EVENT_RECOVERY = 3   # успешная проверка недоступного хоста, порог не достигнут
+EVENT_UP = 4         # хост признан восстановленным
+
+def update_states(now, status, fail, succ, fail_thr, recov_thr, events):
+    """Обновление состояний всех хостов по результатам цикла (1 — ответил).
+    
+    Только целочисленная арифметика над массивами, поэтому функция работает и с
+    bytearray/array, и с numpy-массивами под numba.njit. Результат для каждого
+    хоста записывается в events (EVENT_*).
+    """
+    for i in range(len(now)):
+        s = now[i]
+        up = status[i]
+        # Счётчик растёт только при результате, противоположном текущему состоянию,
+        # и обнуляется при любом другом исходе
+        f = (fail[i] + 1 - s) * (1 - s) * up
+        c = (succ[i] + s) * s * (1 - up)
+        event = EVENT_NONE
+        if f:
+            event = EVENT_FAIL
+            if f >= fail_thr:
+                up = 0
+                f = 0
+                event = EVENT_DOWN
+        elif c:
+            event = EVENT_RECOVERY
+            if c >= recov_thr:
+                up = 1
+                c = 0
+                event = EVENT_UP
+        status[i] = up
+        fail[i] = f
+        succ[i] = c
+        events[i] = event
+
+class TokenBucket:
+    """Ограничитель частоты: не более rate событий за per секунд"""
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+    
+    def acquire(self):
+        """Блокирует вызывающий поток, пока не появится свободный токен"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) * self.per / self.rate)
+
+class IcmpBatcher:
+    """Пинг набора адресов через один ICMP-сокет: все запросы уходят сразу, ответы собираются через poll"""
+    ECHO_REQUEST = 8
+    ECHO_REPLY = 0
+    PAYLOAD = b"ping-monitor"
+    RCVBUF = 4 * 1024 * 1024
+    RECV_EVERY = 32  # Сколько запросов отправлять между чтениями сокета
+    
+    def __init__(self):
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.raw = True
+        except PermissionError:
+            # Непривилегированный ICMP-сокет Linux (net.ipv4.ping_group_range):
+            # ядро само подставляет идентификатор и отдаёт ответ без IP-заголовка
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.raw = False
+        self.sock.setblocking(False)
+        # Запас под ответы сотен хостов (ядро ограничивает значение net.core.rmem_max);
+        # основная защита от переполнения — чтение ответов прямо во время отправки
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RCVBUF)
+        self.poller = select.poll()
+        self.poller.register(self.sock, select.POLLIN)
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+    
+    @staticmethod
+    def checksum(data):
+        if len(data) % 2:
+            data += b"\0"
+        total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+        total = (total >> 16) + (total & 0xFFFF)
+        total += total >> 16
+        return ~total & 0xFFFF
+    
+    def drain(self):
+        """Отбрасывание всего, что накопилось в сокете с прошлого вызова.
+        Raw-сокет получает копию каждого входящего ICMP-пакета, и при переполненном
+        буфере ядро начнёт отбрасывать ответы на наши запросы"""
+        while True:
+            try:
+                self.sock.recv(2048)
+            except BlockingIOError:
+                return
+    
+    def close(self):
+        self.sock.close()
+    
+    def ping(self, addresses, timeout):
+        """Время ответа (сек) для каждого адреса или None, если ответа не было за timeout.
+        Адреса должны быть IPv4-литералами: имена не разрешаются, такие хосты считаются недоступными"""
+        self.drain()
+        results = [None] * len(addresses)
+        pending = {}  # seq -> (индекс, адрес, время отправки)
+        for i, address in enumerate(addresses):
+            try:
+                ipaddress.IPv4Address(address)
+            except ValueError:
+                continue
+            self.seq = (self.seq + 1) & 0xFFFF
+            header = struct.pack('!BBHHH', self.ECHO_REQUEST, 0, 0, self.ident, self.seq)
+            csum = self.checksum(header + self.PAYLOAD)
+            packet = struct.pack('!BBHHH', self.ECHO_REQUEST, 0, csum, self.ident, self.seq) + self.PAYLOAD
+            try:
+                self.sock.sendto(packet, (address, 0))
+            except OSError:
+                continue
+            pending[self.seq] = (i, address, time.monotonic())
+            if len(pending) % self.RECV_EVERY == 0:
+                self.receive(pending, results)
+        
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.poller.poll(remaining * 1000):
+                break
+            self.receive(pending, results)
+        return results
+    
+    def receive(self, pending, results):
+        """Чтение всех ответов, уже пришедших в сокет, без ожидания"""
+        while True:
+            try:
+                data, (source, _) = self.sock.recvfrom(2048)
+            except BlockingIOError:
+                return
+            received = time.monotonic()
+            if self.raw:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, ident, seq = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != self.ECHO_REPLY or (self.raw and ident != self.ident):
+                continue
+            entry = pending.get(seq)
+            if entry and entry[1] == source:
+                del pending[seq]
+                results[entry[0]] = received - entry[2]
 
 class PingMonitor:
     def __init__(self, config_path="config.yaml", hosts_path="hosts.yaml"):
@@ -25,7 +219,30 @@ class PingMonitor:
         # Инициализация
         self.telegram_token = self.config["telegram"]["bot_token"]
         self.chat_id = self.config["telegram"]["chat_id"]
-        self.host_states = {}
+        # Параметры мониторинга не меняются во время работы — читаем один раз
+        monitoring = self.config["monitoring"]
+        self._timeout = monitoring["timeout"]
+        self._fail_thr = monitoring["failure_threshold"]
+        self._recov_thr = monitoring["recovery_threshold"]
+        self._interval = monitoring["check_interval"]
+        self.http = self.create_http_session()
+        # Уведомления отправляются отдельным потоком, чтобы не задерживать цикл пингов
+        self.tg_queue = queue.Queue(maxsize=1000)
+        self._rate = TokenBucket(30, 1.0)   # лимит Telegram ~30 сообщений/сек
+        self.tg_thread = threading.Thread(target=self._telegram_worker, daemon=True)
+        self.tg_thread.start()
+        # Шаблоны уведомлений собираются один раз
+        self._down_tpl = "❌ <b>{name}</b> НЕДОСТУПЕН\nIP: <code>{ip}</code>\nВремя: {t}"
+        self._up_tpl = "✅ <b>{name}</b> восстановлен\nIP: <code>{ip}</code>\nВремя: {t}"
+        self._hosts_listing = "\n".join(f"• <code>{h['ip']:15}</code> {h['name']}" for h in self.config['hosts'])
+        self.fping_path = shutil.which("fping")
+        # ICMP-сокет открывается только когда он нужен (нет fping или fping не сработал)
+        self.icmp = None
+        self.icmp_unavailable = False
+        # Хосты, чьё имя не удалось разрешить при загрузке — повторная попытка в каждом цикле
+        self.unresolved = [h for h in self.config['hosts'] if not self.is_ip_literal(h["_resolved"])]
+        self.pool = ThreadPoolExecutor(max_workers=max(1, min(32, len(self.config['hosts']))))
+        self._hostname = socket.gethostname()
         self.running = True
         self.start_time = datetime.now()
         
@@ -43,22 +260,60 @@ class PingMonitor:
         """Загрузка конфигурации без логгера"""
         try:
             with open(config_path, 'r') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=YamlLoader)
         except Exception as e:
             print(f"[CRITICAL] Ошибка загрузки {config_path}: {e}", file=sys.stderr)
             sys.exit(1)
         
         try:
             with open(hosts_path, 'r') as f:
-                data = yaml.safe_load(f)
+                data = yaml.load(f, Loader=YamlLoader)
                 hosts = data.get("hosts", [])
         except Exception as e:
             print(f"[CRITICAL] Ошибка загрузки {hosts_path}: {e}", file=sys.stderr)
             sys.exit(1)
         
+        # Индекс хоста в массивах состояний и однократное разрешение имён
+        # (чтобы не делать DNS-запрос на каждый пинг)
+        for i, h in enumerate(hosts):
+            h["_idx"] = i
+            h["_resolved"] = self.resolve_host(
+                h["ip"], lambda msg: print(f"[WARNING] {msg}", file=sys.stderr)
+            ) or h["ip"]
+        
         config["hosts"] = hosts
         return config
     
+    @staticmethod
+    def is_ip_literal(address):
+        try:
+            ipaddress.ip_address(address)
+            return True
+        except ValueError:
+            return False
+    
+    def resolve_host(self, address, report):
+        """Разрешение имени хоста в IPv4-адрес (None при ошибке, текст ошибки передаётся в report)"""
+        if self.is_ip_literal(address):
+            return address
+        try:
+            return socket.getaddrinfo(address, None, socket.AF_INET)[0][4][0]
+        except (socket.gaierror, UnicodeError) as e:
+            # UnicodeError — некорректное имя (например, метка длиннее 63 символов)
+            report(f"Не удалось разрешить {address}: {e}")
+            return None
+    
+    def dns_refresher(self, interval=3600):
+        """Фоновое обновление адресов для хостов, заданных по имени"""
+        named = [h for h in self.config['hosts'] if not self.is_ip_literal(h["ip"])]
+        while self.running:
+            time.sleep(interval)
+            for h in named:
+                resolved = self.resolve_host(h["ip"], self.logger.warning)
+                if resolved and resolved != h["_resolved"]:
+                    self.logger.info(f"DNS: {h['ip']} {h['_resolved']} -> {resolved}")
+                    h["_resolved"] = resolved
+    
     def setup_logging(self):
         log_config = self.config.get("logging", {})
         log_file = log_config.get("log_file", "/var/log/ping-monitor.log")
@@ -85,6 +340,37 @@ class PingMonitor:
         self.logger.info(f"Порог восстановления: {self.config['monitoring']['recovery_threshold']} проверок")
         self.logger.info("="*60)
     
+    def create_http_session(self):
+        """Постоянная HTTP-сессия с keep-alive для всех запросов к Telegram"""
+        if httpx is not None:
+            # Одно долгоживущее HTTP/2-соединение (мультиплексирование не используется:
+            # сообщения отправляет один фоновый поток, по очереди). В отличие от сессии
+            # requests, GET-запросы (getMe) при 429/5xx не повторяются; 429 на sendMessage
+            # обрабатывается в _send_now для обоих клиентов
+            return httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+                timeout=10.0
+            )
+        session = requests.Session()
+        # Повторы учитывают заголовок Retry-After; POST сюда не входит — 429 на sendMessage
+        # обрабатывается в _send_now, а повтор после 5xx мог бы продублировать сообщение
+        retry = Retry(total=3, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504],
+                      respect_retry_after_header=True)
+        # pool_maxsize с запасом под фоновую отправку, чтобы соединения не отбрасывались ("Pool is full")
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+        session.headers.update({"Connection": "keep-alive"})
+        return session
+    
+    def create_icmp_batcher(self):
+        """Общий ICMP-сокет для пакетного пинга (None, если открыть сокет не удалось)"""
+        try:
+            return IcmpBatcher()
+        except OSError as e:
+            self.logger.warning(f"⚠️ ICMP-сокет недоступен ({e}), используется ping3")
+            self.icmp_unavailable = True
+            return None
+    
     def validate_telegram_config(self):
         """Проверка корректности настроек Telegram"""
         if not self.telegram_token or self.telegram_token == "YOUR_BOT_TOKEN":
@@ -98,7 +384,7 @@ class PingMonitor:
         # Тест подключения к API
         try:
             url = f"https://api.telegram.org/bot{self.telegram_token}/getMe"
-            response = requests.get(url, timeout=10)
+            response = self.http.get(url, timeout=10)
             data = response.json()
             if not data.get("ok"):
                 self.logger.error(f"✗ Ошибка Telegram API: {data.get('description', 'Unknown')}")
@@ -110,7 +396,29 @@ class PingMonitor:
             sys.exit(1)
     
     def send_telegram(self, text, parse_mode="HTML"):
-        """Отправка сообщения в Telegram через HTTP API"""
+        """Постановка сообщения в очередь на отправку (при переполнении вытесняется самое старое)"""
+        while True:
+            try:
+                self.tg_queue.put_nowait((text, parse_mode))
+                return
+            except queue.Full:
+                try:
+                    self.tg_queue.get_nowait()
+                    self.logger.warning("⚠️ Очередь Telegram переполнена, старое сообщение отброшено")
+                except queue.Empty:
+                    pass
+    
+    def _telegram_worker(self):
+        """Фоновая отправка сообщений из очереди; пустой текст (None) — сигнал остановки"""
+        while True:
+            text, parse_mode = self.tg_queue.get()
+            if text is None:
+                return
+            self._rate.acquire()
+            self._send_now(text, parse_mode)
+    
+    def _send_now(self, text, parse_mode="HTML"):
+        """Синхронная отправка сообщения в Telegram через HTTP API"""
         url = f"https://api.telegram.org/bot{self.telegram_token}/sendMessage"
         payload = {
             "chat_id": self.chat_id,
@@ -119,11 +427,22 @@ class PingMonitor:
         }
         
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = self.http.post(url, json=payload, timeout=10)
             data = response.json()
+            # 429: Telegram сообщает, сколько ждать до повтора (parameters.retry_after).
+            # Ожидание ограничено: _send_now вызывается и синхронно при запуске/остановке
+            retry_after = data.get("parameters", {}).get("retry_after")
+            if not data.get("ok") and retry_after:
+                retry_after = min(retry_after, TELEGRAM_RETRY_AFTER_MAX)
+                self.logger.warning(f"⚠️ Лимит Telegram, повтор через {retry_after} сек")
+                time.sleep(retry_after)
+                response = self.http.post(url, json=payload, timeout=10)
+                data = response.json()
             if data.get("ok"):
                 msg_id = data["result"]["message_id"]
-                preview = text.split('\n')[0][:60].replace('<b>', '').replace('</b>', '').replace('<code>', '').replace('</code>', '')
+                first_nl = text.find('\n')
+                first_line = text if first_nl < 0 else text[:first_nl]
+                preview = TAG_RE.sub('', first_line[:60])
                 self.logger.info(f"📤 Telegram: {preview}...")
                 return True
             else:
@@ -134,31 +453,36 @@ class PingMonitor:
             self.logger.error(f"✗ Исключение при отправке в Telegram: {e}")
             return False
     
+    @staticmethod
+    def _now_str():
+        """Текущее локальное время для текста уведомлений"""
+        return time.strftime('%Y-%m-%d %H:%M:%S')
+    
+    def flush_telegram(self, timeout=10):
+        """Остановка фонового потока после отправки уже поставленных в очередь сообщений"""
+        self.send_telegram(None)
+        self.tg_thread.join(timeout)
+    
     def send_startup_notification(self):
         """Уведомление о запуске бота"""
-        hostname = os.uname().nodename
         start_time = self.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        hosts_list = "\n".join([f"• <code>{h['ip']:15}</code> {h['name']}" for h in self.config['hosts']])
         
         message = (
             f"🚀 <b>Мониторинг запущен</b>\n"
-            f"Сервер: <code>{hostname}</code>\n"
+            f"Сервер: <code>{self._hostname}</code>\n"
             f"Время: {start_time}\n"
             f"Хостов: {len(self.config['hosts'])}\n"
-            f"\nОтслеживаемые хосты:\n{hosts_list}"
+            f"\nОтслеживаемые хосты:\n{self._hosts_listing}"
         )
         
-        if self.send_telegram(message):
+        if self._send_now(message):
             self.logger.info("✅ Уведомление о запуске отправлено")
         else:
             self.logger.warning("⚠️ Не удалось отправить уведомление о запуске")
     
     def send_shutdown_notification(self):
         """Уведомление об остановке бота"""
-        if not self.running:
-            return
-        
-        stop_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        stop_time = self._now_str()
         duration = datetime.now() - self.start_time
         hours, remainder = divmod(duration.total_seconds(), 3600)
         minutes, seconds = divmod(remainder, 60)
@@ -170,88 +494,195 @@ class PingMonitor:
             f"Uptime: {uptime}"
         )
         
-        self.send_telegram(message)
+        self._send_now(message)
         self.logger.info("✅ Уведомление об остановке отправлено")
     
+    def log_ping_result(self, host, rtt):
+        """Отладочная строка с результатом пинга хоста"""
+        response_time = f"{rtt*1000:.1f}ms" if rtt is not None else "N/A"
+        self.logger.debug(f"Пинг {host['name']:20} ({host['ip']:15}): {'✓' if rtt is not None else '✗'} ({response_time})")
+    
     def check_host(self, host):
-        """Проверка доступности хоста через ping"""
+        """Проверка доступности хоста через ping (без изменения состояния, безопасно для потоков)"""
         try:
-            result = ping(host["ip"], timeout=self.config["monitoring"]["timeout"])
+            result = ping(host["_resolved"], timeout=self._timeout)
             status = result is not None and result is not False
-            response_time = f"{result*1000:.1f}ms" if result else "N/A"
-            self.logger.debug(f"Пинг {host['name']:20} ({host['ip']:15}): {'✓' if status else '✗'} ({response_time})")
-            return status
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.log_ping_result(host, result if status else None)
+            return host["ip"], status, result if status else None
         except Exception as e:
             self.logger.error(f"Ошибка проверки {host['name']} ({host['ip']}): {e}")
-            return False
+            return host["ip"], False, None
+    
+    def _batch_ping(self, hosts):
+        """Пинг всех хостов одним вызовом fping. Возвращает статусы по индексам хостов или None при ошибке"""
+        targets = [h["_resolved"] for h in hosts]
+        # fping выдерживает интервал -i между пакетами, поэтому одна отправка занимает
+        # около N × FPING_INTERVAL_MS до начала ожидания ответов (-t)
+        send_time = len(targets) * FPING_INTERVAL_MS / 1000
+        try:
+            result = subprocess.run(
+                [self.fping_path, '-a', '-q', '-r', '0', '-i', str(FPING_INTERVAL_MS),
+                 '-t', str(int(self._timeout * 1000)), *targets],
+                capture_output=True, text=True, timeout=self._timeout + send_time + 2
+            )
+        except Exception as e:
+            self.logger.error(f"Ошибка запуска fping: {e}")
+            return None
+        # Коды 0/1/2 — штатные (все живы / есть недоступные / есть неизвестные имена)
+        if result.returncode > 2:
+            self.logger.error(f"fping завершился с кодом {result.returncode}: {result.stderr.strip()}")
+            return None
+        alive = set(result.stdout.split())
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"fping: доступно {len(alive)} из {len(targets)}")
+        return bytearray(t in alive for t in targets)
+    
+    def ping_all(self, hosts):
+        """Статусы всех хостов за цикл (1 — доступен): fping, если установлен, иначе общий ICMP-сокет,
+        и ping3 в пуле потоков как запасной вариант"""
+        # Имена, не разрешённые при загрузке, пробуем разрешить снова, чтобы
+        # не ждать dns_refresher (до часа) и не делать DNS-запрос внутри пинга
+        for h in self.unresolved[:]:
+            resolved = self.resolve_host(h["ip"], self.logger.debug)
+            if resolved:
+                self.logger.info(f"DNS: {h['ip']} -> {resolved}")
+                h["_resolved"] = resolved
+                self.unresolved.remove(h)
+        if self.fping_path:
+            statuses = self._batch_ping(hosts)
+            if statuses is not None:
+                if self.icmp:
+                    # Не держим открытым сокет, который никто не читает
+                    self.icmp.close()
+                    self.icmp = None
+                return statuses
+        if self.icmp is None and not self.icmp_unavailable:
+            self.icmp = self.create_icmp_batcher()
+        if self.icmp:
+            try:
+                rtts = self.icmp.ping([h["_resolved"] for h in hosts], self._timeout)
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    for host, rtt in zip(hosts, rtts):
+                        self.log_ping_result(host, rtt)
+                return bytearray(rtt is not None for rtt in rtts)
+            except OSError as e:
+                self.logger.error(f"Ошибка ICMP-сокета: {e}")
+        futures = {self.pool.submit(self.check_host, h): h["_idx"] for h in hosts}
+        statuses = bytearray(len(hosts))
+        for future in as_completed(futures):
+            _, status, _ = future.result()
+            statuses[futures[future]] = status
+        return statuses
+    
+    def notify_state_changes(self, host_events, single_tpl, header):
+        """Одно сообщение на все хосты, сменившие состояние за цикл (с разбиением по лимиту Telegram)"""
+        if not host_events:
+            return
+        now = self._now_str()
+        if len(host_events) == 1:
+            host = host_events[0]
+            self.send_telegram(single_tpl.format(name=host['name'], ip=host['ip'], t=now))
+            return
+        footer = f"\nВремя: {now}"
+        message = header
+        for host in host_events:
+            line = f"\n• <code>{host['ip']}</code> {host['name']}"
+            if len(message) + len(line) + len(footer) > TELEGRAM_MAX_LENGTH:
+                self.send_telegram(message + footer)
+                message = header
+            message += line
+        self.send_telegram(message + footer)
     
     def check_all_hosts(self):
-        """Проверка всех хостов"""
-        for host in self.config['hosts']:
-            ip = host["ip"]
-            current_status = self.check_host(host)
-            state = self.host_states.get(ip, {"status": True, "fail_count": 0, "success_count": 0})
-            
-            if current_status != state["status"]:
-                if current_status:  # Восстановление
-                    state["success_count"] += 1
-                    state["fail_count"] = 0
-                    self.logger.info(f"🔄 {host['name']:20} восстановление #{state['success_count']}/{self.config['monitoring']['recovery_threshold']}")
-                    if state["success_count"] >= self.config["monitoring"]["recovery_threshold"]:
-                        state["status"] = True
-                        state["success_count"] = 0
-                        message = (
-                            f"✅ <b>{host['name']}</b> восстановлен\n"
-                            f"IP: <code>{host['ip']}</code>\n"
-                            f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                        )
-                        self.send_telegram(message)
-                else:  # Потеря связи
-                    state["fail_count"] += 1
-                    state["success_count"] = 0
-                    self.logger.warning(f"⚠️ {host['name']:20} недоступен #{state['fail_count']}/{self.config['monitoring']['failure_threshold']}")
-                    if state["fail_count"] >= self.config["monitoring"]["failure_threshold"]:
-                        state["status"] = False
-                        state["fail_count"] = 0
-                        message = (
-                            f"❌ <b>{host['name']}</b> НЕДОСТУПЕН\n"
-                            f"IP: <code>{host['ip']}</code>\n"
-                            f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                        )
-                        self.send_telegram(message)
-            else:
-                # Сброс счётчиков при стабильном состоянии
-                if current_status:
-                    state["success_count"] = 0
-                else:
-                    state["fail_count"] = 0
-            
-            self.host_states[ip] = state
+        """Проверка всех хостов: один пакетный пинг, затем обновление состояний одним проходом по массивам"""
+        hosts = self.config['hosts']
+        statuses = self.ping_all(hosts)
+        if self._jit:
+            statuses = np.frombuffer(statuses, dtype=np.uint8)
+            events = np.zeros(len(hosts), dtype=np.uint8)
+        else:
+            events = bytearray(len(hosts))
+        self._update_states(statuses, self.status, self.fail, self.succ, self._fail_thr, self._recov_thr, events)
+        
+        changed = np.flatnonzero(events) if self._jit else [i for i, e in enumerate(events) if e]
+        down_events = []
+        up_events = []
+        for i in changed:
+            host = hosts[i]
+            event = events[i]
+            if event == EVENT_FAIL:
+                self.logger.warning(f"⚠️ {host['name']:20} недоступен #{self.fail[i]}/{self._fail_thr}")
+            elif event == EVENT_DOWN:
+                self.logger.warning(f"⚠️ {host['name']:20} недоступен #{self._fail_thr}/{self._fail_thr}")
+                down_events.append(host)
+            elif event == EVENT_RECOVERY:
+                self.logger.info(f"🔄 {host['name']:20} восстановление #{self.succ[i]}/{self._recov_thr}")
+            elif event == EVENT_UP:
+                self.logger.info(f"🔄 {host['name']:20} восстановление #{self._recov_thr}/{self._recov_thr}")
+                up_events.append(host)
+        
+        self.notify_state_changes(down_events, self._down_tpl, "❌ <b>Недоступны:</b>")
+        self.notify_state_changes(up_events, self._up_tpl, "✅ <b>Восстановлены:</b>")
     
     def shutdown(self, signum, frame):
-        self.logger.info("Получен сигнал завершения. Остановка мониторинга...")
+        """Обработчик SIGINT/SIGTERM: только снимает флаг, остановка выполняется в run().
+        Очередь и логгер здесь не трогаем — их блокировки могут быть заняты прерванным кодом."""
         self.running = False
+    
+    def stop(self):
+        """Отправка накопленных уведомлений и сообщения об остановке"""
+        self.logger.info("Получен сигнал завершения. Остановка мониторинга...")
+        self.flush_telegram()
         self.send_shutdown_notification()
-        sys.exit(0)
+        self.pool.shutdown(wait=False)
     
     def run(self):
-        # Инициализация состояний
-        for host in self.config['hosts']:
-            self.host_states[host["ip"]] = {"status": True, "fail_count": 0, "success_count": 0}
+        # Инициализация состояний всех хостов заранее, поэтому в цикле проверки
+        # значения по умолчанию не нужны: параллельные массивы по индексу h["_idx"]
+        n = len(self.config['hosts'])
+        # Для большого числа хостов обновление состояний компилируется Numba (если установлена)
+        self._jit = numba is not None and n >= NUMBA_MIN_HOSTS
+        if self._jit:
+            self.status = np.ones(n, dtype=np.uint8)   # 1 — доступен
+            self.fail = np.zeros(n, dtype=np.uint16)
+            self.succ = np.zeros(n, dtype=np.uint16)
+            self._update_states = numba.njit(cache=True)(update_states)
+        else:
+            self.status = bytearray([1] * n)   # 1 — доступен
+            self.fail = array('H', [0] * n)
+            self.succ = array('H', [0] * n)
+            self._update_states = update_states
+        
+        if any(not self.is_ip_literal(h["ip"]) for h in self.config['hosts']):
+            threading.Thread(target=self.dns_refresher, daemon=True).start()
         
         self.logger.info("Мониторинг активен. Нажмите Ctrl+C для остановки.\n")
         
         try:
+            # Расписание по monotonic, чтобы длительность цикла не сдвигала интервал
+            next_tick = time.monotonic()
             while self.running:
                 self.check_all_hosts()
-                time.sleep(self.config["monitoring"]["check_interval"])
+                next_tick += self._interval
+                sleep_for = next_tick - time.monotonic()
+                if sleep_for <= 0:
+                    self.logger.warning(f"Цикл проверки превысил интервал на {-sleep_for:.2f} сек")
+                    next_tick = time.monotonic()
+                # Сон короткими отрезками, чтобы после сигнала не ждать конца интервала
+                while self.running and sleep_for > 0:
+                    time.sleep(min(sleep_for, 1))
+                    sleep_for = next_tick - time.monotonic()
+            self.stop()
         except KeyboardInterrupt:
             self.logger.info("Остановка по Ctrl+C")
-            self.shutdown(None, None)
+            self.running = False
+            self.stop()
         except Exception as e:
             self.logger.exception(f"Критическая ошибка: {e}")
             try:
-                self.send_telegram(f"⚠️ Мониторинг остановлен из-за ошибки:\n<code>{str(e)[:100]}</code>")
+                self.flush_telegram()
+                self._send_now(f"⚠️ Мониторинг остановлен из-за ошибки:\n<code>{str(e)[:100]}</code>")
             except:
                 pass
         finally:
@@ -261,7 +692,6 @@ if __name__ == "__main__":
     # Проверка прав на пинг (ICMP)
     python_path = sys.executable
     try:
-        import subprocess
         result = subprocess.run(['getcap', python_path], capture_output=True, text=True)
         if 'cap_net_raw' not in result.stdout:
             print(f"⚠️  Внимание: Python не имеет прав на отправку ICMP-пакетов")
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import sys
+import socket
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 
 print("="*60)
@@ -34,11 +37,16 @@ if not chat_id or chat_id == "YOUR_CHAT_ID":
     sys.exit(1)
 print(f"Chat ID: {chat_id}")
 
+# Одна keep-alive сессия на оба запроса к API
+http = requests.Session()
+http.mount("https://", HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])))
+http.headers.update({"Connection": "keep-alive"})
+
 # Тест подключения к API
 print("\nПроверка подключения к Telegram API...")
 api_url = f"https://api.telegram.org/bot{token}/getMe"
 try:
-    response = requests.get(api_url, timeout=10)
+    response = http.get(api_url, timeout=10)
     data = response.json()
     if data.get("ok"):
         bot_info = data["result"]
@@ -54,7 +62,7 @@ except Exception as e:
 
 # Отправка тестового сообщения
 print(f"\nОтправка тестового сообщения в чат {chat_id}...")
-test_msg = f"✅ ТЕСТ УСПЕШЕН!\nСервер: {__import__('os').uname().nodename}\nВремя: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+test_msg = f"✅ ТЕСТ УСПЕШЕН!\nСервер: {socket.gethostname()}\nВремя: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
 send_url = f"https://api.telegram.org/bot{token}/sendMessage"
 payload = {
     "chat_id": chat_id,
@@ -63,7 +71,7 @@ payload = {
 }
 
 try:
-    response = requests.post(send_url, json=payload, timeout=10)
+    response = http.post(send_url, json=payload, timeout=10)
     data = response.json()
     if data.get("ok"):
         print(f"✓ Сообщение доставлено! Message ID: {data['result']['message_id']}")